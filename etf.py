@@ -0,0 +1,71 @@
+import gzip
+from collections import defaultdict, namedtuple
+
+Resource = namedtuple("Resource", ["id", "capacity", "name"])
+Claim = namedtuple("Claim", ["id", "start", "end", "resource", "amount", "attributes"])
+Event = namedtuple("Event", ["id", "time", "attributes"])
+Signal = namedtuple("Signal", ["id", "name"])
+Fragment = namedtuple("Fragment", ["signal", "start", "end", "coefficients"])
+
+
+def open_trace(path, mode='rt'):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def parse_attributes(text):
+    attributes = {}
+    for item in text.split(","):
+        key, _, value = item.partition("=")
+        if key.strip():
+            attributes[key.strip()] = value.strip()
+    return attributes
+
+
+def parse_record(line):
+    fields, _, attributes = line.rstrip("\n").partition(";")
+    fields = fields.split()
+    if not fields:
+        return None
+    kind = fields[0]
+    if kind == "R":
+        return Resource(int(fields[1]), float(fields[2]), parse_attributes(attributes).get("name", fields[1]))
+    if kind == "C":
+        return Claim(int(fields[1]), float(fields[2]), float(fields[3]), int(fields[4]), float(fields[5]), parse_attributes(attributes))
+    if kind == "E":
+        return Event(int(fields[1]), float(fields[2]), parse_attributes(attributes))
+    if kind == "S":
+        return Signal(int(fields[1]), parse_attributes(attributes).get("name", fields[1]))
+    if kind == "F":
+        return Fragment(int(fields[1]), float(fields[2]), float(fields[3]), tuple(float(value) for value in fields[4:]))
+    return None
+
+
+def read_records(path):
+    with open_trace(path) as file:
+        for line in file:
+            record = parse_record(line)
+            if record is not None:
+                yield record
+
+
+def resource_utilization(records):
+    resources = {}
+    busy = defaultdict(float)
+    horizon = 0.0
+
+    for record in records:
+        if isinstance(record, Resource):
+            resources[record.id] = record
+        elif isinstance(record, Claim):
+            busy[record.resource] += (record.end - record.start) * record.amount
+            horizon = max(horizon, record.end)
+        elif isinstance(record, Event):
+            horizon = max(horizon, record.time)
+        elif isinstance(record, Fragment):
+            horizon = max(horizon, record.end)
+
+    if horizon == 0:
+        return {resource.name: 0.0 for resource in resources.values()}
+    return {resource.name: busy[resource.id] / (resource.capacity * horizon) for resource in resources.values()}
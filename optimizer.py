@@ -0,0 +1,90 @@
+import math
+import random
+
+
+class Memo:
+    def __init__(self, evaluate_batch, budget):
+        self.evaluate_batch = evaluate_batch
+        self.budget = budget
+        self.fitness = {}
+        self.best = None
+
+    @property
+    def exhausted(self):
+        return len(self.fitness) >= self.budget
+
+    def __call__(self, candidates):
+        unseen = list(dict.fromkeys(candidate for candidate in candidates if candidate not in self.fitness))
+        unseen = unseen[:max(0, self.budget - len(self.fitness))]
+        if unseen:
+            for candidate, value in self.evaluate_batch(unseen).items():
+                self.fitness[candidate] = -math.inf if value is None else value
+                if self.best is None or self.fitness[candidate] > self.fitness[self.best]:
+                    self.best = candidate
+        return [self.fitness.get(candidate, -math.inf) for candidate in candidates]
+
+
+def genetic_algorithm(choices, evaluate_batch, budget, population_size=12, mutation_rate=None, elite=2,
+                      patience=5, rng=None):
+    rng = rng or random.Random()
+    mutation_rate = mutation_rate or 1 / len(choices)
+    memo = Memo(evaluate_batch, budget)
+    population = [tuple(rng.choice(levels) for levels in choices) for _ in range(population_size)]
+    stale = 0
+
+    while not memo.exhausted and stale < patience:
+        previous_best = memo.best
+        scores = memo(population)
+        ranked = [candidate for _, candidate in sorted(zip(scores, population), key=lambda pair: -pair[0])]
+
+        def tournament():
+            a, b = rng.sample(range(len(ranked)), 2)
+            return ranked[min(a, b)]
+
+        children = ranked[:elite]
+        while len(children) < population_size:
+            mother, father = tournament(), tournament()
+            child = [rng.choice(genes) for genes in zip(mother, father)]
+            for i, levels in enumerate(choices):
+                if rng.random() < mutation_rate:
+                    child[i] = rng.choice(levels)
+            children.append(tuple(child))
+        population = children
+        stale = stale + 1 if memo.best == previous_best else 0
+
+    return memo
+
+
+def tabu_search(choices, evaluate_batch, budget, start=None, tenure=None, patience=5, rng=None):
+    rng = rng or random.Random()
+    tenure = tenure or len(choices)
+    memo = Memo(evaluate_batch, budget)
+    current = start or tuple(rng.choice(levels) for levels in choices)
+    memo([current])
+    tabu = []
+    stale = 0
+
+    while not memo.exhausted and stale < patience:
+        previous_best = memo.best
+        # Saved before the neighbourhood is evaluated, which may already move memo.best to one of the neighbours.
+        best_fitness = memo.fitness[memo.best]
+        moves = [(i, level) for i, levels in enumerate(choices) for level in levels if level != current[i]]
+        neighbours = [current[:i] + (level,) + current[i + 1:] for i, level in moves]
+        scores = memo(neighbours)
+
+        best_move = None
+        for move, neighbour, score in sorted(zip(moves, neighbours, scores), key=lambda item: -item[2]):
+            # A tabu move is still allowed when it improves on the best configuration found so far.
+            if move not in tabu or score > best_fitness:
+                best_move = (move, neighbour)
+                break
+        if best_move is None:
+            break
+
+        (i, _), current_next = best_move
+        tabu.append((i, current[i]))
+        del tabu[:-tenure]
+        current = current_next
+        stale = stale + 1 if memo.best == previous_best else 0
+
+    return memo
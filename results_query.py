@@ -0,0 +1,213 @@
+import argparse
+import csv
+import io
+import json
+import os
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from script import COMPONENTS, LEVELS, RESULTS_FILE, RESULTS_STREAM, describe_configuration
+
+COMPONENT_COLUMNS = dict(zip(COMPONENTS, ("BeltSpeed", "IndexSpeed", "GantrySpeed1", "GantrySpeed2")))
+METRICS = ("Makespan", "Profit")
+
+
+class ResultsIndex:
+    def __init__(self, path=RESULTS_FILE, stream=RESULTS_STREAM):
+        self.path = path
+        self.stream = stream
+        self.source = None
+        self._reset()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _reset(self):
+        self.offset = 0
+        self.inode = None
+        self.modified = None
+        self.header = None
+        self.header_line = b""
+        self.last_line = b""
+        self.codes = np.zeros((0, len(COMPONENTS)), dtype=np.int8)
+        self.metrics = {metric: np.zeros(0) for metric in METRICS}
+        self._index()
+
+    def _unchanged(self, file):
+        # Appending keeps the header and everything up to the offset and makes the file grow; a rewrite (end of a sweep,
+        # watch mode, results with extra columns) replaces the file, changes its first or last indexed line, or changes it
+        # without making it grow.
+        stat = os.fstat(file.fileno())
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            return False
+        if stat.st_size == self.offset and stat.st_mtime_ns != self.modified:
+            return False
+        header_line = file.readline()
+        file.seek(self.offset - len(self.last_line))
+        return header_line == self.header_line and file.read(len(self.last_line)) == self.last_line
+
+    def refresh(self):
+        # While a sweep runs, its rows are streamed to a separate file that replaces the results file once it completes.
+        source = self.stream if self.stream and os.path.exists(self.stream) else self.path
+        if source != self.source:
+            self._reset()
+            self.source = source
+        try:
+            file = open(source, 'rb')
+        except FileNotFoundError:
+            return 0
+        with file:
+            if self.offset and not self._unchanged(file):
+                self._reset()
+            file.seek(self.offset)
+            chunk = file.read()
+            stat = os.fstat(file.fileno())
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+
+        rows = list(csv.reader(io.StringIO(complete.decode(), newline='')))
+        header, header_line = self.header, self.header_line
+        if header is None and rows:
+            header, header_line = rows.pop(0), complete[:complete.find(b"\n") + 1]
+        rows = [row for row in rows if row and row != header]
+        try:
+            column = {name: i for i, name in enumerate(header or ())}
+            codes = np.array([[LEVELS.index(row[column[COMPONENT_COLUMNS[component]]]) for component in COMPONENTS] for row in rows],
+                             dtype=np.int8).reshape(-1, len(COMPONENTS))
+            metrics = {metric: [float(row[column[metric]]) for row in rows] for metric in METRICS}
+        except (KeyError, IndexError, ValueError):
+            if not self.offset:
+                raise
+            # Rows that do not parse under the indexed header were written over it; index the whole file again.
+            self._reset()
+            return self.refresh()
+
+        # Only advance once the new rows are parsed, so that rows which failed to parse are read again on the next refresh.
+        self.offset += len(complete)
+        self.inode, self.modified = stat.st_ino, stat.st_mtime_ns
+        self.header, self.header_line = header, header_line
+        if complete:
+            self.last_line = complete[complete.rfind(b"\n", 0, len(complete) - 1) + 1:]
+        if not rows:
+            return 0
+        self.codes = np.concatenate([self.codes, codes])
+        for metric in METRICS:
+            self.metrics[metric] = np.concatenate([self.metrics[metric], metrics[metric]])
+        self._index()
+        return len(rows)
+
+    def _index(self):
+        self.order = {metric: np.argsort(values, kind="stable") for metric, values in self.metrics.items()}
+        self.sorted = {metric: values[self.order[metric]] for metric, values in self.metrics.items()}
+        self.bitmaps = {(component, level): self.codes[:, i] == code
+                        for i, component in enumerate(COMPONENTS) for code, level in enumerate(LEVELS)}
+
+    def mask(self, makespan_min=None, makespan_max=None, profit_min=None, profit_max=None, **levels):
+        mask = np.ones(len(self), dtype=bool)
+        for component, level in levels.items():
+            if level is not None:
+                mask &= self.bitmaps[(component, level)]
+        for metric, low, high in (("Makespan", makespan_min, makespan_max), ("Profit", profit_min, profit_max)):
+            if low is None and high is None:
+                continue
+            # Range conditions are answered from the sorted index with two binary searches.
+            begin = np.searchsorted(self.sorted[metric], low, side="left") if low is not None else 0
+            end = np.searchsorted(self.sorted[metric], high, side="right") if high is not None else len(self)
+            in_range = np.zeros(len(self), dtype=bool)
+            in_range[self.order[metric][begin:end]] = True
+            mask &= in_range
+        return mask
+
+    def rows(self, selection):
+        return [{**{COMPONENT_COLUMNS[component]: LEVELS[code] for component, code in zip(COMPONENTS, self.codes[i])},
+                 **{metric: float(self.metrics[metric][i]) for metric in METRICS},
+                 "Configuration": describe_configuration(*(LEVELS[code] for code in self.codes[i]))}
+                for i in selection]
+
+    def filter(self, **conditions):
+        return self.rows(np.flatnonzero(self.mask(**conditions)))
+
+    def top(self, k=10, by="Profit", ascending=False, **conditions):
+        mask = self.mask(**conditions)
+        order = self.order[by] if ascending else self.order[by][::-1]
+        return self.rows(order[mask[order]][:k])
+
+    def group_by(self, component, metric="Profit", **conditions):
+        mask = self.mask(**conditions)
+        groups = {}
+        for level in LEVELS:
+            values = self.metrics[metric][mask & self.bitmaps[(component, level)]]
+            if len(values):
+                groups[level] = {"count": int(len(values)), "mean": float(values.mean()), "min": float(values.min()),
+                                 "max": float(values.max())}
+        return groups
+
+
+def query_arguments(params):
+    conditions = {}
+    for key, values in params.items():
+        value = values[-1]
+        if key in COMPONENTS:
+            conditions[key] = value
+        elif key in ("makespan_min", "makespan_max", "profit_min", "profit_max"):
+            conditions[key] = float(value)
+    return conditions
+
+
+def serve(index, host="127.0.0.1", port=8765):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            try:
+                index.refresh()
+            except (OSError, KeyError, IndexError, ValueError) as error:
+                self.send_error(500, f"cannot read {index.source}: {error}")
+                return
+            try:
+                conditions = query_arguments(params)
+                if url.path == "/filter":
+                    body = index.filter(**conditions)
+                elif url.path == "/top":
+                    body = index.top(int(params.get("k", ["10"])[-1]), by=params.get("by", ["Profit"])[-1],
+                                     ascending=params.get("order", ["desc"])[-1] == "asc", **conditions)
+                elif url.path == "/groupby":
+                    body = index.group_by(params["by"][-1], metric=params.get("metric", ["Profit"])[-1], **conditions)
+                else:
+                    self.send_error(404, "expected /filter, /top or /groupby")
+                    return
+            except (KeyError, ValueError) as error:
+                self.send_error(400, f"invalid query: {error}")
+                return
+
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    # Single-threaded on purpose: refresh() mutates the index in place.
+    server = HTTPServer((host, port), Handler)
+    print(f"Serving {index.source} ({len(index)} results) on http://{host}:{port}")
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve indexed queries on design space results")
+    parser.add_argument("--results", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+    parser.add_argument("--stream", default=RESULTS_STREAM,
+                        help=f"file a running sweep streams its rows to, followed while it exists (default: {RESULTS_STREAM})")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    serve(ResultsIndex(args.results, args.stream), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
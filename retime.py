@@ -0,0 +1,204 @@
+import argparse
+import csv
+import heapq
+import math
+import time
+from collections import defaultdict
+
+from etf import Claim, Event, Fragment, Resource, read_records
+from script import COMPONENTS, LEVELS, describe_configuration, parse_configuration
+
+COMPONENT_RESOURCES = {
+    "belt": ("Belt_1", "Belt_2", "Belt_3", "Belt_4", "Belt_5"),
+    "index": ("IndexTable_2",),
+    "gantry1": ("Gantry_1",),
+    "gantry2": ("Gantry_2",),
+}
+
+# Range of speed factors (duration multipliers) searched when calibrating against sweep results.
+CALIBRATION_RANGE = (0.05, 20.0)
+CALIBRATION_GRID = 40
+CALIBRATION_TOLERANCE = 1e-3
+
+# Trace times are printed with limited precision, so claims are matched on rounded times.
+TIME_DECIMALS = 4
+
+
+def build_precedence(path):
+    resources = {}
+    claims = []
+    horizon = 0.0
+    for record in read_records(path):
+        if isinstance(record, Resource):
+            resources[record.id] = record.name
+        elif isinstance(record, Claim):
+            claims.append(record)
+            horizon = max(horizon, record.end)
+        elif isinstance(record, Event):
+            horizon = max(horizon, record.time)
+        elif isinstance(record, Fragment):
+            horizon = max(horizon, record.end)
+
+    claims.sort(key=lambda claim: (claim.start, claim.end))
+
+    # A claim waits for the latest earlier claim on its resource and for the latest earlier claim of its product,
+    # keeping the original gap between them. Claims come in start order, so per chain the claims still running are kept
+    # in a heap by end time and only the latest finished one is remembered.
+    running = defaultdict(list)
+    finished = {}
+    predecessors = []
+    for i, claim in enumerate(claims):
+        pid = claim.attributes.get("pid", "-1")
+        chains = [("resource", claim.resource)] + ([("pid", pid)] if pid != "-1" else [])
+        links = []
+        for chain in chains:
+            heap = running[chain]
+            while heap and round(heap[0][0], TIME_DECIMALS) <= round(claim.start, TIME_DECIMALS):
+                end, j = heapq.heappop(heap)
+                if chain not in finished or end > claims[finished[chain]].end:
+                    finished[chain] = j
+            if chain in finished:
+                j = finished[chain]
+                links.append((j, claim.start - claims[j].end))
+            heapq.heappush(heap, (claim.end, i))
+        predecessors.append(links)
+
+    return {
+        "starts": [claim.start for claim in claims],
+        "durations": [claim.end - claim.start for claim in claims],
+        "resources": [resources.get(claim.resource, str(claim.resource)) for claim in claims],
+        "predecessors": predecessors,
+        "makespan": horizon,
+        "tail": horizon - max((claim.end for claim in claims), default=0.0),
+    }
+
+
+def retime(structure, scale):
+    ends = []
+    for start, duration, resource, predecessors in zip(structure["starts"], structure["durations"], structure["resources"],
+                                                        structure["predecessors"]):
+        if predecessors:
+            start = max(ends[j] + gap for j, gap in predecessors)
+        ends.append(start + duration * scale.get(resource, 1.0))
+    return max(ends, default=0.0) + structure["tail"]
+
+
+def resource_scale(config, base, factors):
+    scale = {}
+    for component, level, base_level in zip(COMPONENTS, config, base):
+        if level != base_level:
+            for resource in COMPONENT_RESOURCES[component]:
+                scale[resource] = factors[component][level] / factors[component][base_level]
+    return scale
+
+
+class Estimator:
+    def __init__(self, structure, base, base_makespan=None):
+        self.structure = structure
+        self.base = base
+        # Scale the re-timed trace to the makespan of the full simulation of the base configuration when it is known.
+        self.ratio = base_makespan / structure["makespan"] if base_makespan else 1.0
+        self.factors = {component: {level: 1.0 for level in LEVELS} for component in COMPONENTS}
+        self.calibrated_on = set()
+
+    def estimate(self, config):
+        return self.ratio * retime(self.structure, resource_scale(config, self.base, self.factors))
+
+    def fit(self, component, level, samples):
+        def error(factor):
+            self.factors[component][level] = factor
+            return sum(abs(self.estimate(config) - makespan) for config, makespan in samples)
+
+        # The error is piecewise linear in the factor and need not be unimodal: a log-spaced grid finds the right basin,
+        # golden-section search then refines the factor continuously within it.
+        low, high = map(math.log, CALIBRATION_RANGE)
+        grid = [low + (high - low) * k / (CALIBRATION_GRID - 1) for k in range(CALIBRATION_GRID)]
+        k = min(range(CALIBRATION_GRID), key=lambda k: error(math.exp(grid[k])))
+        a, b = grid[max(0, k - 1)], grid[min(CALIBRATION_GRID - 1, k + 1)]
+        ratio = (math.sqrt(5) - 1) / 2
+        while b - a > CALIBRATION_TOLERANCE:
+            c, d = b - ratio * (b - a), a + ratio * (b - a)
+            if error(math.exp(c)) <= error(math.exp(d)):
+                b = d
+            else:
+                a = c
+        factor = self.factors[component][level] = math.exp((a + b) / 2)
+        if not 1.01 * CALIBRATION_RANGE[0] < factor < CALIBRATION_RANGE[1] / 1.01:
+            print(f"Warning: speed factor {component}={level} hit the calibration bound {factor:.2f}; "
+                  f"the re-timed trace barely reacts to it")
+
+    def calibrate(self, measured):
+        used = {self.base} & set(measured)
+        unmatched = []
+        for i, component in enumerate(COMPONENTS):
+            for level in LEVELS:
+                if level == self.base[i]:
+                    continue
+                samples = [(config, makespan) for config, makespan in measured.items() if config[i] == level
+                           and all(value == base_value for j, (value, base_value) in enumerate(zip(config, self.base)) if j != i)]
+                if samples:
+                    self.fit(component, level, samples)
+                    used.update(config for config, _ in samples)
+                else:
+                    unmatched.append((i, component, level))
+
+        # Without a configuration that differs from the base in this component only, fit on every configuration with the
+        # level, given the factors calibrated so far for the other components.
+        for i, component, level in unmatched:
+            samples = [(config, makespan) for config, makespan in measured.items() if config[i] == level]
+            if not samples:
+                print(f"Warning: no simulated configuration with {component}={level}; its speed factor stays 1.00")
+                continue
+            print(f"Warning: no simulated configuration differs from the base in {component}={level} only; "
+                  f"calibrating it on {len(samples)} configuration(s) with other components changed as well")
+            self.fit(component, level, samples)
+            used.update(config for config, _ in samples)
+        self.calibrated_on = used
+        return self.factors
+
+
+def read_results(path):
+    measured = {}
+    with open(path, 'r', newline='') as file:
+        for row in csv.DictReader(file):
+            config = (row["BeltSpeed"], row["IndexSpeed"], row["GantrySpeed1"], row["GantrySpeed2"])
+            measured[config] = float(row["Makespan"])
+    return measured
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate what-if makespans by re-timing a simulated trace")
+    parser.add_argument("trace", help="trace of the base configuration (.etf or .etf.gz)")
+    parser.add_argument("--base", type=parse_configuration, required=True, metavar="BELT,INDEX,GANTRY1,GANTRY2",
+                        help="configuration the trace was simulated with")
+    parser.add_argument("--results", default="design_space_results.csv", help="sweep results used for calibration and validation")
+    parser.add_argument("--what-if", type=parse_configuration, action="append", default=[], metavar="BELT,INDEX,GANTRY1,GANTRY2",
+                        help="configuration to estimate (repeatable)")
+    args = parser.parse_args(argv)
+
+    measured = read_results(args.results)
+    estimator = Estimator(build_precedence(args.trace), args.base, measured.get(args.base))
+    estimator.calibrate(measured)
+    for component in COMPONENTS:
+        print(f"Speed factors {component}: " + ", ".join(f"{level}={factor:.2f}" for level, factor in estimator.factors[component].items()))
+
+    start = time.perf_counter()
+    errors = {config: (estimator.estimate(config) - makespan) / makespan for config, makespan in measured.items()}
+    per_estimate = (time.perf_counter() - start) / max(1, len(measured))
+    # Configurations used for calibration fit by construction; only the others tell how well the estimator generalises.
+    for label, selected in (("in-sample", [error for config, error in errors.items() if config in estimator.calibrated_on]),
+                            ("held-out", [error for config, error in errors.items() if config not in estimator.calibrated_on])):
+        if selected:
+            print(f"Validation on {len(selected)} {label} simulated configurations: mean absolute error "
+                  f"{sum(map(abs, selected)) / len(selected):.1%}, max {max(map(abs, selected)):.1%}")
+    if errors:
+        print(f"{per_estimate * 1000:.2f} ms per estimate")
+
+    for config in args.what_if:
+        estimate = estimator.estimate(config)
+        simulated = f", simulated {measured[config]:.2f}" if config in measured else ""
+        print(f"Configuration: {describe_configuration(*config)} | Estimated makespan: {estimate:.2f}{simulated}")
+
+
+if __name__ == "__main__":
+    main()
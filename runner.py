@@ -0,0 +1,200 @@
+import csv
+import os
+import re
+import signal
+import statistics
+import subprocess
+import time
+from collections import namedtuple
+
+MAKESPAN_PREFIX = "Makespan : "
+
+MISSING_BINARY = "missing_binary"
+PARSE_ERROR = "parse_error"
+TIMEOUT = "timeout"
+OOM_KILLED = "oom_killed"
+NO_MAKESPAN = "no_makespan"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Only failures caused by the node (overload, memory pressure) are worth retrying.
+TRANSIENT_FAILURES = {TIMEOUT, OOM_KILLED}
+
+PARSE_ERROR_PATTERN = re.compile(r"parse error|syntax error|unexpected token|undefined|unknown (class|method|variable)|compil", re.IGNORECASE)
+OOM_PATTERN = re.compile(r"out of memory|bad_alloc|cannot allocate memory|\boom\b", re.IGNORECASE)
+
+# Claim that ends when a finished product leaves the line; one per product.
+COMPLETION_CLAIM = "MoveAtBelt5"
+
+RunOutcome = namedtuple("RunOutcome", ["makespan", "failure", "attempts", "duration", "detail"])
+
+
+def parse_makespan(output):
+    for line in output.split("\n"):
+        if MAKESPAN_PREFIX in line:
+            try:
+                return float(line.split(MAKESPAN_PREFIX)[1].strip())
+            except ValueError:
+                return None
+    return None
+
+
+def classify_failure(returncode, stdout, stderr):
+    if returncode == 0:
+        return None if parse_makespan(stdout) is not None else NO_MAKESPAN
+    if returncode in (-signal.SIGKILL, 128 + signal.SIGKILL) or OOM_PATTERN.search(stderr):
+        return OOM_KILLED
+    if PARSE_ERROR_PATTERN.search(stderr) or PARSE_ERROR_PATTERN.search(stdout):
+        return PARSE_ERROR
+    return FAILED
+
+
+class AdaptiveTimeout:
+    def __init__(self, initial=3600.0, floor=30.0, factor=3.0, quantile=0.95, min_samples=5):
+        self.initial = initial
+        self.floor = floor
+        self.factor = factor
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.durations = []
+
+    def record(self, duration):
+        self.durations.append(duration)
+
+    def current(self):
+        if len(self.durations) < self.min_samples:
+            return self.initial
+        ordered = sorted(self.durations)
+        high = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+        return max(self.floor, self.factor * high)
+
+
+def execute(command, timeout=None, cwd=None, cancelled=None, poll=0.5):
+    start = time.perf_counter()
+    try:
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=cwd)
+    except FileNotFoundError:
+        return RunOutcome(None, MISSING_BINARY, 1, time.perf_counter() - start, f"{command[0]} not found")
+
+    with proc:
+        while True:
+            elapsed = time.perf_counter() - start
+            if timeout is not None and elapsed >= timeout:
+                proc.kill()
+                proc.communicate()
+                return RunOutcome(None, TIMEOUT, 1, time.perf_counter() - start, f"no result after {timeout:.1f}s")
+            # The caller may learn while the run is in progress that its result is no longer needed.
+            if cancelled is not None and cancelled():
+                proc.kill()
+                proc.communicate()
+                return RunOutcome(None, CANCELLED, 1, time.perf_counter() - start, "result no longer needed")
+            wait = [limit for limit in (poll if cancelled else None, timeout - elapsed if timeout is not None else None)
+                    if limit is not None]
+            try:
+                stdout, stderr = proc.communicate(timeout=min(wait, default=None))
+                break
+            except subprocess.TimeoutExpired:
+                continue
+    duration = time.perf_counter() - start
+
+    failure = classify_failure(proc.returncode, stdout, stderr)
+    if failure:
+        detail = (stderr.strip() or stdout.strip()).splitlines()[-1:] or [f"exit code {proc.returncode}"]
+        return RunOutcome(None, failure, 1, duration, detail[0])
+    return RunOutcome(parse_makespan(stdout), None, 1, duration, "")
+
+
+def completion_time(line, marker=COMPLETION_CLAIM):
+    if not line.startswith("C ") or f"name={marker}" not in line:
+        return None
+    return float(line.split()[3])
+
+
+def steady_interval(completions, window, tolerance):
+    # The first completion includes the warm-up, so only intervals after it are compared.
+    intervals = [b - a for a, b in zip(completions, completions[1:])]
+    if len(intervals) < 2 * window:
+        return None
+    recent = statistics.mean(intervals[-window:])
+    previous = statistics.mean(intervals[-2 * window:-window])
+    return recent if abs(recent - previous) <= tolerance * recent else None
+
+
+def execute_until_steady(command, products, window=3, tolerance=0.05, cwd=None, timeout=None, poll=0.2, trace_file="trace.etf"):
+    cwd = cwd or os.getcwd()
+    trace_path = os.path.join(cwd, trace_file)
+    start = time.perf_counter()
+    completions = []
+    position = 0
+    partial = ""
+
+    with open(os.path.join(cwd, "stdout.txt"), 'w+') as stdout, open(os.path.join(cwd, "stderr.txt"), 'w+') as stderr:
+        try:
+            proc = subprocess.Popen(command, stdout=stdout, stderr=stderr, text=True, cwd=cwd)
+        except FileNotFoundError:
+            return RunOutcome(None, MISSING_BINARY, 1, 0.0, f"{command[0]} not found"), None
+
+        while True:
+            finished = proc.poll() is not None
+            if os.path.exists(trace_path):
+                with open(trace_path, 'r') as trace:
+                    trace.seek(position)
+                    chunk = trace.read()
+                    position = trace.tell()
+                lines = (partial + chunk).split("\n")
+                partial = lines.pop()
+                completions += [t for t in map(completion_time, lines) if t is not None]
+                completions.sort()
+
+            interval = steady_interval(completions, window, tolerance) if not finished else None
+            if interval is not None and len(completions) < products:
+                proc.terminate()
+                proc.wait()
+                makespan = completions[-1] + (products - len(completions)) * interval
+                return RunOutcome(makespan, None, 1, time.perf_counter() - start, ""), len(completions)
+
+            if finished:
+                break
+            if timeout is not None and time.perf_counter() - start > timeout:
+                proc.kill()
+                proc.wait()
+                return RunOutcome(None, TIMEOUT, 1, time.perf_counter() - start, f"no result after {timeout:.1f}s"), None
+            time.sleep(poll)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        out, err = stdout.read(), stderr.read()
+
+    duration = time.perf_counter() - start
+    failure = classify_failure(proc.returncode, out, err)
+    if failure:
+        detail = (err.strip() or out.strip()).splitlines()[-1:] or [f"exit code {proc.returncode}"]
+        return RunOutcome(None, failure, 1, duration, detail[0]), None
+    return RunOutcome(parse_makespan(out), None, 1, duration, ""), None
+
+
+def run_with_retries(command, timeouts=None, retries=3, backoff=2.0, cwd=None, cancelled=None):
+    elapsed = 0.0
+    for attempt in range(1, retries + 2):
+        timeout = timeouts.current() if timeouts else None
+        if timeout is not None and attempt > 1:
+            # A run that timed out may simply be slow; give each retry more room.
+            timeout *= 2 ** (attempt - 1)
+        outcome = execute(command, timeout=timeout, cwd=cwd, cancelled=cancelled)
+        elapsed += outcome.duration
+
+        if outcome.failure is None:
+            if timeouts:
+                timeouts.record(outcome.duration)
+            return outcome._replace(attempts=attempt, duration=elapsed)
+        if outcome.failure not in TRANSIENT_FAILURES or attempt > retries:
+            return outcome._replace(attempts=attempt, duration=elapsed)
+        time.sleep(backoff * 2 ** (attempt - 1))
+
+
+def write_failure_report(failures, path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["BeltSpeed", "IndexSpeed", "GantrySpeed1", "GantrySpeed2", "Failure", "Attempts", "Duration", "Detail"])
+        for config, outcome in failures:
+            writer.writerow([*config, outcome.failure, outcome.attempts, f"{outcome.duration:.2f}", outcome.detail])
@@ -0,0 +1,71 @@
+import csv
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def load_durations(path):
+    history = defaultdict(list)
+    if not os.path.exists(path):
+        return history
+    with open(path, 'r', newline='') as file:
+        for row in csv.reader(file):
+            if row and row[-1] != "Duration":
+                history[tuple(row[:-1])].append(float(row[-1]))
+    return history
+
+
+def record_durations(path, durations, header):
+    new = not os.path.exists(path)
+    with open(path, 'a', newline='') as file:
+        writer = csv.writer(file)
+        if new:
+            writer.writerow(header)
+        for config, duration in durations:
+            writer.writerow([*config, f"{duration:.3f}"])
+
+
+def predict_runtimes(configurations, history, levels):
+    # Additive model: runtime = intercept + one effect per (component, level), fitted on all past runs.
+    def features(config):
+        return [1.0] + [float(value == level) for value in config for level in levels[1:]]
+
+    samples = [(config, duration) for config, durations in history.items() for duration in durations
+               if len(config) == len(configurations[0]) and all(value in levels for value in config)] if configurations else []
+    if samples:
+        coefficients = np.linalg.lstsq(np.array([features(config) for config, _ in samples]),
+                                       np.array([duration for _, duration in samples]), rcond=None)[0]
+
+    predicted = {}
+    for config in configurations:
+        if history.get(config):
+            predicted[config] = float(np.mean(history[config]))
+        elif samples:
+            predicted[config] = max(0.0, float(np.dot(features(config), coefficients)))
+        else:
+            # Without any history, slower components mean longer simulated (and simulation) time.
+            predicted[config] = float(sum(len(levels) - levels.index(value) for value in config))
+    return predicted
+
+
+def schedule(tasks, predicted, run, workers):
+    # Longest expected first; idle workers pull the next task from the shared queue as soon as they finish.
+    order = sorted(tasks, key=lambda task: -predicted[task])
+    durations = {}
+
+    def timed(task):
+        start = time.perf_counter()
+        result = run(task)
+        durations[task] = time.perf_counter() - start
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(order, pool.map(timed, order)))
+    elapsed = time.perf_counter() - start
+
+    ideal = max(sum(durations.values()) / workers, max(durations.values())) if durations else 0.0
+    return results, durations, elapsed, ideal
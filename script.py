@@ -1,23 +1,70 @@
-import subprocess
 import os
+import re
+import math
+import time
+import argparse
+import tempfile
+import statistics
+import random
+import hashlib
+import functools
+import glob
+import gzip
+import shutil
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
 import plotly.express as px
 
+from etf import read_records, resource_utilization
+from signals import belt_summary
+from optimizer import genetic_algorithm, tabu_search
+from scheduler import load_durations, predict_runtimes, record_durations, schedule
+from runner import CANCELLED, TRANSIENT_FAILURES, AdaptiveTimeout, execute_until_steady, run_with_retries, write_failure_report
+
 ROTALUMIS = os.path.expanduser("~/.p2/pool/plugins/nl.tue.rotalumis.executables_4.3.0.202310160813/linux/64bit/rotalumis")
 trace_ini_path = os.path.expanduser("~/eclipse-workspace/xcps/models/trace.ini")
 model_file = os.path.expanduser("~/eclipse-workspace/xcps/models/xcps-model.poosl")
 
-MAKESPAN_PREFIX = "Makespan : "
+FAILURE_REPORT = "design_space_failures.csv"
+
+LEVELS = ("slow", "normal", "fast")
+COMPONENTS = ("belt", "index", "gantry1", "gantry2")
+
+# Model parameter holding the number of products in a batch, e.g. "nrOfProducts := 10".
+PRODUCT_COUNT_KEY = "nrOfProducts"
+
+# Settings overridden in the generated trace.ini for the short screening runs.
+SCREEN_TRACE_SETTINGS = {"claims": "false", "events": "false", "signals": "false"}
+SCREEN_TRACE_INI = "trace.screen.ini"
+
+# Minimal event configuration for makespan-only runs, written from scratch rather than derived from trace.ini.
+NO_TRACE_SETTINGS = {"trace": "false", "claims": "false", "events": "false", "signals": "false"}
 
+# RAM-backed directory for per-run model and config files; the default temp directory is used if unavailable.
+RAM_SCRATCH = "/dev/shm"
 
-def parse_makespan(output):
-    for line in output.split("\n"):
-        if MAKESPAN_PREFIX in line:
-            try:
-                return float(line.split(MAKESPAN_PREFIX)[1].strip())
-            except ValueError:
-                return None
-    return None
+RESULTS_FILE = "design_space_results.csv"
+RESULTS_PLOT = "design_space_results.html"
+RESULT_COLUMNS = ["BeltSpeed", "IndexSpeed", "GantrySpeed1", "GantrySpeed2", "Makespan", "Profit"]
+REPLICATION_COLUMNS = RESULT_COLUMNS + ["MakespanCI", "Replications"]
+STEADY_STATE_COLUMNS = RESULT_COLUMNS + ["Extrapolated", "ExtrapolationError", "TimeSaved"]
+# Rows are appended here as they are simulated, so the previous results file stays intact until a sweep completes.
+RESULTS_STREAM = "design_space_results.partial.csv"
+
+# Trace written by rotalumis into the working directory of a run.
+TRACE_FILE = "trace.etf"
+UTILIZATION_FILE = "design_space_utilization.csv"
+BELTS_FILE = "design_space_belts.csv"
+# Run times depend on how much is traced and archived, so each kind of run keeps its own history.
+DURATIONS_FILE = "design_space_durations_{mode}.csv"
+
+# Lines rewritten by update_poosl_model; they are not part of the model as edited by the user.
+CONFIGURATION_LINE = re.compile(r"add(Slow|Normal|Fast)(Belts|Index|Arm1|Arm2)")
+
+# Rotalumis option that seeds the random number generator of the model.
+SEED_OPTION = "--seed"
 
 
 def update_poosl_model(belt, index, gantry1, gantry2, model_path):
@@ -38,16 +85,64 @@ def update_poosl_model(belt, index, gantry1, gantry2, model_path):
         file.writelines(data)
 
 
-def run_performance_model(trace_ini, model):
-    try:
-        proc = subprocess.run(
-            [ROTALUMIS, "--stdlib", "-e", trace_ini, "--poosl", model],
-            capture_output=True,
-            text=True
-        )
-        return parse_makespan(proc.stdout) if proc.returncode == 0 else None
-    except FileNotFoundError:
-        return None
+def write_model_variant(config, model_path):
+    # Variants live next to the model so that its relative imports still resolve.
+    # Read the model first, so that a missing model does not leave an empty variant behind.
+    with open(model_path, 'r') as model:
+        data = model.read()
+    handle, path = tempfile.mkstemp(prefix=".variant-", suffix=".poosl", dir=os.path.dirname(model_path))
+    with os.fdopen(handle, 'w') as variant:
+        variant.write(data)
+    update_poosl_model(*config, path)
+    return path
+
+
+def read_product_count(model_path):
+    with open(model_path, 'r') as file:
+        match = re.search(rf"{PRODUCT_COUNT_KEY}\s*:=\s*(\d+)", file.read())
+    return int(match.group(1)) if match else None
+
+
+def set_product_count(products, model_path):
+    with open(model_path, 'r') as file:
+        data = file.read()
+
+    data = re.sub(rf"({PRODUCT_COUNT_KEY}\s*:=\s*)\d+", rf"\g<1>{products}", data)
+
+    with open(model_path, 'w') as file:
+        file.write(data)
+
+
+def write_trace_ini(settings, base_path, out_path):
+    data = []
+    if base_path:
+        with open(base_path, 'r') as file:
+            data = file.readlines()
+
+    remaining = dict(settings)
+    for i, line in enumerate(data):
+        key = line.split("=")[0].strip()
+        if "=" in line and key in remaining:
+            data[i] = f"{key}={remaining.pop(key)}\n"
+    if data and not data[-1].endswith("\n"):
+        data[-1] += "\n"
+    data.extend(f"{key}={value}\n" for key, value in remaining.items())
+
+    with open(out_path, 'w') as file:
+        file.writelines(data)
+    return out_path
+
+
+def rotalumis_command(trace_ini, model, seed=None):
+    command = [ROTALUMIS, "--stdlib", "-e", trace_ini, "--poosl", model]
+    if seed is not None:
+        command += [SEED_OPTION, str(seed)]
+    return command
+
+
+def run_performance_model(trace_ini, model, timeouts=None, retries=0, seed=None, cwd=None, cancelled=None):
+    return run_with_retries(rotalumis_command(trace_ini, model, seed), timeouts=timeouts, retries=retries, cwd=cwd,
+                            cancelled=cancelled)
 
 
 def calculate_profit(makespan, belt, index, gantry1, gantry2, adjustments):
@@ -81,7 +176,556 @@ def calculate_profit(makespan, belt, index, gantry1, gantry2, adjustments):
     return profit
 
 
+def describe_configuration(belt, index, gantry1, gantry2):
+    return f"Belt={belt}, Index={index}, Gantry1={gantry1}, Gantry2={gantry2}"
+
+
+def trace_name(belt, index, gantry1, gantry2):
+    return f"{belt}-{index}-{gantry1}-{gantry2}.etf.gz"
+
+
+def archive_trace(config, trace_dir, trace_file=TRACE_FILE):
+    os.makedirs(trace_dir, exist_ok=True)
+    path = os.path.join(trace_dir, trace_name(*config))
+    with open(trace_file, 'rb') as source, gzip.open(path, 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target)
+    return path
+
+
+def analyze_trace(path):
+    # Parse each trace once and reduce it to all of its vectors.
+    records = list(read_records(path))
+    return resource_utilization(records), belt_summary(records)
+
+
+def trace_matrices(trace_dir, reduce, workers=None):
+    paths = sorted(glob.glob(os.path.join(trace_dir, "*.etf.gz")))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        reduced = list(pool.map(reduce, paths, chunksize=4))
+
+    configurations = [describe_configuration(*os.path.basename(path)[:-len(".etf.gz")].split("-")) for path in paths]
+    matrices = []
+    for vectors in zip(*reduced):
+        df = pd.DataFrame(list(vectors), index=pd.Index(configurations, name="Configuration")).fillna(0.0)
+        matrices.append(df[sorted(df.columns)])
+    return matrices
+
+
+def report_failure(config, outcome, failures=None):
+    print(f"Configuration: {describe_configuration(*config)} | "
+          f"Failed ({outcome.failure}) after {outcome.attempts} attempt(s): {outcome.detail}")
+    if failures is not None:
+        failures.append((config, outcome))
+
+
+def sweep(configurations, trace_ini, model, adjustments=1, timeouts=None, retries=3, failures=None, trace_dir=None,
+          stream=None):
+    results = []
+
+    for belt, index, gantry1, gantry2 in configurations:
+        update_poosl_model(belt, index, gantry1, gantry2, model)
+        previous = os.path.getmtime(TRACE_FILE) if os.path.exists(TRACE_FILE) else None
+        outcome = run_performance_model(trace_ini, model, timeouts=timeouts, retries=retries)
+        makespan = outcome.makespan
+
+        if outcome.failure:
+            report_failure((belt, index, gantry1, gantry2), outcome, failures)
+        elif makespan:
+            profit = calculate_profit(makespan, belt[0], index[0], gantry1[0], gantry2[0], adjustments=adjustments)
+            results.append((belt, index, gantry1, gantry2, makespan, profit))
+            print(f"Configuration: {describe_configuration(belt, index, gantry1, gantry2)} | Makespan: {makespan:.2f}, Profit: {profit:.2f}")
+            if stream:
+                stream_result(stream, results[-1])
+            # Only a trace written by this run belongs to this configuration, not one left in the working directory.
+            if trace_dir and os.path.exists(TRACE_FILE) and os.path.getmtime(TRACE_FILE) != previous:
+                archive_trace((belt, index, gantry1, gantry2), trace_dir)
+
+    return results
+
+
+def rank_correlation(a, b):
+    a, b = pd.Series(a).rank(), pd.Series(b).rank()
+    if len(a) < 2 or a.std() == 0 or b.std() == 0:
+        return float("nan")
+    return a.corr(b)
+
+
+def screening_horizons(full_products):
+    # Two points suffice for the affine fit; keep them small so that screening costs a fraction of a full sweep.
+    short = max(2, round(0.1 * full_products))
+    return short, max(short + 1, round(0.2 * full_products))
+
+
+def extrapolate_makespan(makespans, full_products):
+    # Makespan is affine in the batch size once the line is filled: warm-up + (n - 1) * interval.
+    (n1, m1), (n2, m2) = sorted(makespans.items())
+    interval = (m2 - m1) / (n2 - n1)
+    return m1 + (full_products - n1) * interval
+
+
+def screen(configurations, trace_ini, model, fraction, horizons=None, adjustments=1, timeouts=None, retries=3, failures=None,
+           stream=None):
+    full_products = read_product_count(model)
+    if full_products is None:
+        raise ValueError(f"{PRODUCT_COUNT_KEY} not found in {model}")
+    horizons = sorted(set(horizons or screening_horizons(full_products)))
+    if len(horizons) != 2 or horizons[1] >= full_products:
+        raise ValueError(f"screening needs two different horizons below the full batch of {full_products} products")
+    screen_ini = write_trace_ini(SCREEN_TRACE_SETTINGS, trace_ini, os.path.join(os.path.dirname(trace_ini), SCREEN_TRACE_INI))
+
+    # Short runs take a fraction of the time of full ones, so they learn their own timeout.
+    short_timeouts = AdaptiveTimeout(initial=timeouts.initial) if timeouts else AdaptiveTimeout()
+    start = time.perf_counter()
+    short = defaultdict(dict)
+    try:
+        remaining = configurations
+        for products in horizons:
+            set_product_count(products, model)
+            for row in sweep(remaining, screen_ini, model, timeouts=short_timeouts, retries=retries, failures=failures):
+                short[row[:4]][products] = row[4]
+            # A configuration that failed is reported once, not again for the next batch size.
+            remaining = [config for config in remaining if products in short[config]]
+    finally:
+        set_product_count(full_products, model)
+        os.remove(screen_ini)
+    screen_time = time.perf_counter() - start
+
+    screened = []
+    for config in configurations:
+        if len(short[config]) == 2:
+            makespan = extrapolate_makespan(short[config], full_products)
+            belt, index, gantry1, gantry2 = config
+            profit = calculate_profit(makespan, belt[0], index[0], gantry1[0], gantry2[0], adjustments=adjustments)
+            screened.append((belt, index, gantry1, gantry2, makespan, profit))
+
+    screened.sort(key=lambda row: (-row[5], row[4]))
+    keep = screened[:max(1, math.ceil(fraction * len(screened)))] if screened else []
+
+    start = time.perf_counter()
+    results = sweep([row[:4] for row in keep], trace_ini, model, adjustments=adjustments, timeouts=timeouts, retries=retries,
+                    failures=failures, stream=stream)
+    full_time = time.perf_counter() - start
+
+    extrapolated = {row[:4]: row[5] for row in screened}
+    correlation = rank_correlation([extrapolated[row[:4]] for row in results], [row[5] for row in results])
+    print(f"Screening: {len(screened)} configurations with {' and '.join(map(str, horizons))}/{full_products} products in {screen_time:.1f}s, "
+          f"{len(results)} rerun at full fidelity in {full_time:.1f}s")
+    print(f"Spearman rank correlation between stages: {correlation:.3f}")
+
+    return screened, results, correlation
+
+
+def simulate_configuration(config, trace_ini, model, timeouts=None, retries=3, scratch=None, trace_dir=None, cancelled=None):
+    variant = write_model_variant(config, model)
+    try:
+        with tempfile.TemporaryDirectory(dir=scratch) as workdir:
+            outcome = run_performance_model(trace_ini, variant, timeouts=timeouts, retries=retries, cwd=workdir, cancelled=cancelled)
+            trace_file = os.path.join(workdir, TRACE_FILE)
+            if trace_dir and outcome.failure is None and os.path.exists(trace_file):
+                archive_trace(config, trace_dir, trace_file)
+            return outcome
+    finally:
+        os.remove(variant)
+
+
+def scratch_directory():
+    root = RAM_SCRATCH if os.path.isdir(RAM_SCRATCH) and os.access(RAM_SCRATCH, os.W_OK) else None
+    return tempfile.TemporaryDirectory(prefix="xcps-", dir=root)
+
+
+def mirror_model(model, scratch):
+    model_dir = os.path.dirname(model)
+    for name in os.listdir(model_dir):
+        if name.endswith(".poosl") and not name.startswith(".variant-"):
+            shutil.copy(os.path.join(model_dir, name), scratch)
+    return os.path.join(scratch, os.path.basename(model))
+
+
+def parallel_evaluator(trace_ini, model, adjustments=1, workers=None, timeouts=None, retries=3, results=None, failures=None,
+                       scratch=None, trace_dir=None, mode=None, stream=None):
+    workers = workers or os.cpu_count()
+    durations_file = DURATIONS_FILE.format(mode=mode or ("archived" if trace_dir else "traced"))
+    history = load_durations(durations_file)
+    lock = threading.Lock()
+
+    def profit_of(config, makespan):
+        belt, index, gantry1, gantry2 = config
+        return calculate_profit(makespan, belt[0], index[0], gantry1[0], gantry2[0], adjustments=adjustments)
+
+    def simulate(config):
+        outcome = simulate_configuration(config, trace_ini, model, timeouts, retries, scratch, trace_dir)
+        # Streamed as soon as the run finishes rather than at the end of the batch.
+        if stream and outcome.failure is None:
+            with lock:
+                stream_result(stream, (*config, outcome.makespan, profit_of(config, outcome.makespan)))
+        return outcome
+
+    def evaluate_batch(configurations):
+        predicted = predict_runtimes(configurations, history, LEVELS)
+        outcomes, durations, elapsed, ideal = schedule(configurations, predicted, simulate, workers)
+
+        succeeded = [(config, durations[config]) for config in configurations if outcomes[config].failure is None]
+        for config, duration in succeeded:
+            history[config].append(duration)
+        record_durations(durations_file, succeeded, ["BeltSpeed", "IndexSpeed", "GantrySpeed1", "GantrySpeed2", "Duration"])
+        if elapsed > 0:
+            print(f"Simulated {len(configurations)} configuration(s) on {workers} worker(s) in {elapsed:.1f}s "
+                  f"(ideal {ideal:.1f}s, scheduling efficiency {ideal / elapsed:.0%})")
+
+        fitness = {}
+        for config in configurations:
+            outcome = outcomes[config]
+            if outcome.failure:
+                report_failure(config, outcome, failures)
+                fitness[config] = None
+                continue
+            profit = profit_of(config, outcome.makespan)
+            if results is not None:
+                results.append((*config, outcome.makespan, profit))
+            print(f"Configuration: {describe_configuration(*config)} | Makespan: {outcome.makespan:.2f}, Profit: {profit:.2f}")
+            fitness[config] = profit
+        return fitness
+
+    return evaluate_batch
+
+
+def optimize(method, trace_ini, model, budget, workers=None, seed=None, timeouts=None, retries=3, failures=None, stream=None):
+    results = []
+    evaluate_batch = parallel_evaluator(trace_ini, model, workers=workers, timeouts=timeouts, retries=retries,
+                                        results=results, failures=failures, stream=stream)
+    choices = [LEVELS] * len(COMPONENTS)
+    rng = random.Random(seed)
+
+    if method == "ga":
+        # One generation per parallel batch, but small enough to leave room for several generations within the budget.
+        population_size = max(4, min(workers or os.cpu_count(), budget // 4))
+        memo = genetic_algorithm(choices, evaluate_batch, budget, population_size=population_size, rng=rng)
+    else:
+        memo = tabu_search(choices, evaluate_batch, budget, rng=rng)
+
+    if memo.best is not None and memo.fitness[memo.best] > -math.inf:
+        print(f"Best of {len(memo.fitness)} simulated configurations (full enumeration: {len(LEVELS) ** len(COMPONENTS)}): "
+              f"{describe_configuration(*memo.best)} | Profit: {memo.fitness[memo.best]:.2f}")
+    return results
+
+
+def makespan_sweep(configurations, trace_ini, model, inspect=(), trace_dir="traces", workers=None, timeouts=None, retries=3,
+                   failures=None, stream=None):
+    results = []
+    with scratch_directory() as scratch:
+        scratch_model = mirror_model(model, scratch)
+        quiet_ini = write_trace_ini(NO_TRACE_SETTINGS, None, os.path.join(scratch, "trace.ini"))
+        evaluate_batch = parallel_evaluator(quiet_ini, scratch_model, workers=workers, timeouts=timeouts, retries=retries,
+                                            results=results, failures=failures, scratch=scratch, mode="untraced",
+                                            stream=stream)
+        evaluate_batch([config for config in configurations if config not in inspect])
+
+    if inspect:
+        evaluate_batch = parallel_evaluator(trace_ini, model, workers=workers, timeouts=timeouts, retries=retries,
+                                            results=results, failures=failures, trace_dir=trace_dir, stream=stream)
+        evaluate_batch(list(inspect))
+        print(f"Full traces of {len(inspect)} inspected configuration(s) kept in {trace_dir}")
+    return results
+
+
+def steady_state_sweep(configurations, trace_ini, model, window=3, tolerance=0.05, validate=False, adjustments=1, timeouts=None,
+                       retries=3, failures=None, stream=None):
+    products = read_product_count(model)
+    if products is None:
+        raise ValueError(f"{PRODUCT_COUNT_KEY} not found in {model}")
+    results = []
+
+    for config in configurations:
+        belt, index, gantry1, gantry2 = config
+        variant = write_model_variant(config, model)
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                outcome, completed = execute_until_steady(rotalumis_command(trace_ini, variant), products, window=window, tolerance=tolerance,
+                                                          cwd=workdir, timeout=timeouts.current() if timeouts else None)
+            if outcome.failure is None and completed is None and timeouts:
+                timeouts.record(outcome.duration)
+            # A run that timed out or ran out of memory gets the remaining retries from the regular runner; other failures
+            # (broken model, missing binary) would only fail again.
+            if outcome.failure in TRANSIENT_FAILURES and retries > 0:
+                first = outcome
+                with tempfile.TemporaryDirectory() as workdir:
+                    outcome = run_performance_model(trace_ini, variant, timeouts=timeouts, retries=retries - 1, cwd=workdir)
+                outcome = outcome._replace(attempts=outcome.attempts + 1, duration=outcome.duration + first.duration)
+
+            error = float("nan")
+            if outcome.failure is None and completed and validate:
+                with tempfile.TemporaryDirectory() as workdir:
+                    full = run_performance_model(trace_ini, variant, timeouts=timeouts, retries=retries, cwd=workdir)
+                if full.failure is None:
+                    error = (outcome.makespan - full.makespan) / full.makespan
+        finally:
+            os.remove(variant)
+
+        if outcome.failure:
+            report_failure(config, outcome, failures)
+            continue
+
+        # Simulation time grows with the number of simulated products, so the rest of the batch would have taken this long.
+        saved = outcome.duration * (products - completed) / completed if completed else 0.0
+        profit = calculate_profit(outcome.makespan, belt[0], index[0], gantry1[0], gantry2[0], adjustments=adjustments)
+        results.append((belt, index, gantry1, gantry2, outcome.makespan, profit, bool(completed), error, saved))
+        if stream:
+            stream_result(stream, results[-1], STEADY_STATE_COLUMNS)
+        stopped = f" (extrapolated from {completed}/{products} products, {saved:.1f}s saved)" if completed else ""
+        validated = f", extrapolation error {error:+.2%}" if error == error else ""
+        print(f"Configuration: {describe_configuration(*config)} | Makespan: {outcome.makespan:.2f}{stopped}, Profit: {profit:.2f}{validated}")
+
+    return results
+
+
+def parse_configuration(text):
+    config = tuple(level.strip() for level in text.split(","))
+    if len(config) != len(COMPONENTS) or any(level not in LEVELS for level in config):
+        raise argparse.ArgumentTypeError(f"expected {len(COMPONENTS)} comma-separated levels out of {', '.join(LEVELS)}")
+    return config
+
+
+@functools.lru_cache(maxsize=None)
+def t_quantile(df, confidence):
+    # Two-sided Student t critical value: bisection on the CDF, integrated with Simpson's rule.
+    # Series approximations are too narrow for the few samples the stopping rule starts from.
+    log_norm = math.lgamma((df + 1) / 2) - math.lgamma(df / 2) - 0.5 * math.log(df * math.pi)
+
+    def central(t, steps=2000):
+        h = t / steps
+        pdf = [math.exp(log_norm - (df + 1) / 2 * math.log1p((i * h) ** 2 / df)) for i in range(steps + 1)]
+        return h / 3 * (pdf[0] + pdf[-1] + 4 * sum(pdf[1:-1:2]) + 2 * sum(pdf[2:-1:2]))
+
+    target = confidence / 2
+    low, high = 0.0, 1.0
+    while central(high) < target:
+        low, high = high, 2 * high
+    for _ in range(50):
+        middle = (low + high) / 2
+        low, high = (middle, high) if central(middle) < target else (low, middle)
+    return (low + high) / 2
+
+
+def confidence_halfwidth(samples, confidence=0.95):
+    if len(samples) < 2:
+        return float("inf")
+    t = t_quantile(len(samples) - 1, confidence)
+    return t * statistics.stdev(samples) / math.sqrt(len(samples))
+
+
+def replicate(configurations, trace_ini, model, adjustments=1, precision=0.01, confidence=0.95,
+              min_replications=3, max_replications=30, workers=None, timeouts=None, retries=3, failures=None, stream=None):
+    workers = workers or os.cpu_count()
+    results = []
+    best_lower = -math.inf
+
+    for config in configurations:
+        belt, index, gantry1, gantry2 = config
+        update_poosl_model(belt, index, gantry1, gantry2, model)
+        samples = []
+        failed = None
+        status = "max replications"
+        # Every configuration reuses the same seeds (common random numbers) so comparisons between them are less noisy.
+        seed = 0
+
+        def profit_of(makespan):
+            return calculate_profit(makespan, belt[0], index[0], gantry1[0], gantry2[0], adjustments=adjustments)
+
+        def run_replication(replication_seed):
+            with tempfile.TemporaryDirectory() as workdir:
+                return run_performance_model(trace_ini, model, timeouts=timeouts, retries=retries, seed=replication_seed, cwd=workdir)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while len(samples) < max_replications:
+                batch = min(max_replications - len(samples), max(min_replications - len(samples), workers))
+                outcomes = list(pool.map(run_replication, range(seed, seed + batch)))
+                seed += batch
+                samples += [outcome.makespan for outcome in outcomes if outcome.failure is None]
+                failed = next((outcome for outcome in outcomes if outcome.failure), None)
+                if failed or len(samples) < min_replications:
+                    break
+
+                mean = statistics.mean(samples)
+                halfwidth = confidence_halfwidth(samples, confidence)
+                if halfwidth <= precision * mean:
+                    status = "converged"
+                    break
+                # Profit decreases with makespan, so the upper profit bound comes from the lower makespan bound.
+                if profit_of(mean - halfwidth) < best_lower:
+                    status = "dominated"
+                    break
+
+        if failed:
+            report_failure(config, failed, failures)
+            # Replications that succeeded before the failure still give an estimate once there are enough of them.
+            if len(samples) < min_replications:
+                continue
+            status = "failed"
+
+        mean = statistics.mean(samples)
+        halfwidth = confidence_halfwidth(samples, confidence)
+        profit = profit_of(mean)
+        best_lower = max(best_lower, profit_of(mean + halfwidth))
+        results.append((belt, index, gantry1, gantry2, mean, profit, halfwidth, len(samples)))
+        if stream:
+            stream_result(stream, results[-1], REPLICATION_COLUMNS)
+        print(f"Configuration: {describe_configuration(*config)} | Makespan: {mean:.2f} +/- {halfwidth:.2f} "
+              f"({len(samples)} replications, {status}), Profit: {profit:.2f}")
+
+    return results
+
+
+def results_frame(results, columns=RESULT_COLUMNS):
+    df = pd.DataFrame(results, columns=columns)
+    df["Configuration"] = [describe_configuration(*row[:4]) for row in results]
+    return df
+
+
+def stream_result(stream, row, columns=RESULT_COLUMNS):
+    # Same formatting as the final results file, so readers tailing it see identical rows.
+    results_frame([row], columns).to_csv(stream, mode='a', header=not os.path.exists(stream), index=False)
+
+
+def plot_results(df, path=None):
+    fig = px.scatter(
+        df, x="Makespan", y="Profit", color="Configuration", size=[10] * len(df), title="Makespan vs Profit",
+        labels={"Makespan": "Makespan (s)", "Profit": "Profit ($)"}
+    )
+    if path:
+        fig.write_html(path)
+    else:
+        fig.show()
+
+
+def pareto_front(results):
+    return [row for row in results
+            if not any(other[4] <= row[4] and other[5] >= row[5] and (other[4], other[5]) != (row[4], row[5]) for other in results)]
+
+
+def model_fingerprint(model_path):
+    with open(model_path, 'r') as file:
+        lines = [line for line in file if not CONFIGURATION_LINE.search(line)]
+    return hashlib.sha1("".join(lines).encode()).hexdigest()
+
+
+def file_fingerprint(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def watched_fingerprints(model, trace_ini):
+    # Editors that save by writing a temporary file and renaming it briefly leave no file behind.
+    try:
+        return {model: model_fingerprint(model), trace_ini: file_fingerprint(trace_ini)}
+    except FileNotFoundError:
+        return None
+
+
+def watch(configurations, trace_ini, model, adjustments=1, interval=1.0, timeouts=None, retries=3):
+    cache = {}
+    fingerprints = None
+    queue = []
+
+    while True:
+        current = watched_fingerprints(model, trace_ini)
+        if current is None:
+            time.sleep(interval)
+            continue
+        if current != fingerprints:
+            changed = [path for path in current if fingerprints is None or fingerprints[path] != current[path]]
+            fingerprints = current
+            previous = [row for row, _ in cache.values()]
+            best = sorted(previous, key=lambda row: -row[5])[:1]
+            first = [row[:4] for row in best + pareto_front(previous)]
+            queue = list(dict.fromkeys(first + [config for config in configurations if config not in first]))
+            print(f"Change detected in {', '.join(os.path.basename(path) for path in changed)}: "
+                  f"re-simulating {len(first)} best and Pareto-optimal configuration(s) first, {len(queue)} in total")
+            pending_priority = len(first)
+
+        if not queue:
+            time.sleep(interval)
+            continue
+
+        config = queue[0]
+        # Simulate a copy so that the model the user is editing is never rewritten, and stop it as soon as the user saves.
+        try:
+            outcome = simulate_configuration(config, trace_ini, model, timeouts, retries,
+                                             cancelled=lambda: watched_fingerprints(model, trace_ini) != fingerprints)
+        except FileNotFoundError:
+            time.sleep(interval)
+            continue
+        if outcome.failure == CANCELLED:
+            continue
+        queue.pop(0)
+
+        # Results of a run during which the user saved again are stale; the next iteration requeues them.
+        if watched_fingerprints(model, trace_ini) == fingerprints:
+            if outcome.failure:
+                report_failure(config, outcome)
+                cache.pop(config, None)
+            else:
+                belt, index, gantry1, gantry2 = config
+                profit = calculate_profit(outcome.makespan, belt[0], index[0], gantry1[0], gantry2[0], adjustments=adjustments)
+                print(f"Configuration: {describe_configuration(*config)} | Makespan: {outcome.makespan:.2f}, Profit: {profit:.2f}")
+                cache[config] = ((belt, index, gantry1, gantry2, outcome.makespan, profit), fingerprints)
+
+        pending_priority -= 1
+        if pending_priority <= 0 or not queue:
+            fresh = [row for row, used in cache.values() if used == fingerprints]
+            df = results_frame(fresh)
+            df.to_csv(RESULTS_FILE, index=False)
+            plot_results(df, RESULTS_PLOT)
+            if pending_priority == 0 and fresh:
+                best = max(fresh, key=lambda row: row[5])
+                print(f"Best so far: {describe_configuration(*best[:4])} | Makespan: {best[4]:.2f}, Profit: {best[5]:.2f}")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Design space exploration of the xCPS model")
+    parser.add_argument("--screen", type=float, metavar="FRACTION",
+                        help="screen all configurations with short runs and rerun only this top fraction at full length")
+    parser.add_argument("--screen-products", type=int, nargs=2, metavar=("SHORT", "LONGER"),
+                        help="the two batch sizes simulated in the screening stage to fit warm-up and per-product interval "
+                             "(default: 10%% and 20%% of the model's batch, at least 2 and 3)")
+    parser.add_argument("--replications", action="store_true",
+                        help="run seeded replications in parallel until the makespan confidence interval is narrow enough")
+    parser.add_argument("--precision", type=float, default=0.01,
+                        help="target confidence interval half-width relative to the mean makespan (default: 0.01)")
+    parser.add_argument("--max-replications", type=int, default=30,
+                        help="maximum number of replications per configuration (default: 30)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of simulations run in parallel (default: number of CPUs)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and re-simulate when the model or trace.ini changes, best configurations first")
+    parser.add_argument("--keep-traces", metavar="DIR",
+                        help="keep a gzip-compressed copy of the trace of every configuration in DIR")
+    parser.add_argument("--analyze-traces", metavar="DIR",
+                        help="reduce every trace in DIR to per-resource utilization and write a configuration x resource matrix")
+    parser.add_argument("--makespan-only", action="store_true",
+                        help="sweep without trace output, with all per-run files in a RAM-backed scratch directory")
+    parser.add_argument("--inspect", type=parse_configuration, action="append", default=[], metavar="BELT,INDEX,GANTRY1,GANTRY2",
+                        help="with --makespan-only, simulate this configuration with full tracing and keep its trace (repeatable)")
+    parser.add_argument("--steady-state", action="store_true",
+                        help="stop runs once the product completion interval has converged and extrapolate the makespan")
+    parser.add_argument("--steady-window", type=int, default=3,
+                        help="number of completion intervals compared between consecutive windows (default: 3)")
+    parser.add_argument("--steady-tolerance", type=float, default=0.05,
+                        help="relative difference between window means that counts as converged (default: 0.05)")
+    parser.add_argument("--validate", action="store_true",
+                        help="with --steady-state, also run every stopped configuration in full to measure the extrapolation error")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="retries for runs that time out or are killed by the OOM killer (default: 3)")
+    parser.add_argument("--timeout", type=float, default=3600.0,
+                        help="per-run timeout in seconds until enough run durations are known to adapt it (default: 3600)")
+    subparsers = parser.add_subparsers(dest="command")
+    optimize_parser = subparsers.add_parser("optimize", help="search the design space with a metaheuristic instead of enumerating it")
+    optimize_parser.add_argument("--method", choices=("ga", "tabu"), default="ga",
+                                 help="genetic algorithm or tabu search (default: ga)")
+    optimize_parser.add_argument("--budget", type=int, default=30,
+                                 help="maximum number of distinct configurations to simulate (default: 30)")
+    optimize_parser.add_argument("--seed", type=int, default=None, help="seed of the search itself")
+    args = parser.parse_args()
+
     configurations = [
         ("slow", "slow", "slow", "slow"),
         ("slow", "slow", "slow", "normal"),
@@ -166,23 +810,77 @@ if __name__ == "__main__":
         ("fast", "fast", "fast", "fast")
     ]
 
-    results = []
+    if args.analyze_traces:
+        if not glob.glob(os.path.join(args.analyze_traces, "*.etf.gz")):
+            parser.error(f"no archived traces (*.etf.gz) in {args.analyze_traces}")
+        utilization, belts = trace_matrices(args.analyze_traces, analyze_trace, workers=args.workers)
+        utilization.to_csv(UTILIZATION_FILE)
+        belts.to_csv(BELTS_FILE)
+        bottlenecks = utilization.idxmax(axis=1)
+        for configuration, resource in bottlenecks.items():
+            print(f"Configuration: {configuration} | Bottleneck: {resource} ({utilization.loc[configuration, resource]:.1%})")
+        print(bottlenecks.value_counts().to_string())
+        if not belts.empty:
+            print(f"Belt distance (energy proxy) per configuration written to {BELTS_FILE}, "
+                  f"lowest: {belts['TotalDistance'].idxmin()} ({belts['TotalDistance'].min():.0f})")
+        parser.exit()
 
-    for belt, index, gantry1, gantry2 in configurations:
-        update_poosl_model(belt, index, gantry1, gantry2, model_file)
-        makespan = run_performance_model(trace_ini_path, model_file)
+    timeouts = AdaptiveTimeout(initial=args.timeout)
+    failures = []
 
-        if makespan:
-            profit = calculate_profit(makespan, belt[0], index[0], gantry1[0], gantry2[0], adjustments=1)
-            results.append((belt, index, gantry1, gantry2, makespan, profit))
-            print(f"Configuration: Belt={belt}, Index={index}, Gantry1={gantry1}, Gantry2={gantry2} | Makespan: {makespan:.2f}, Profit: {profit:.2f}")
+    columns = list(RESULT_COLUMNS)
+    # Rows left over from an interrupted sweep would be mixed with the rows of this one.
+    if os.path.exists(RESULTS_STREAM):
+        os.remove(RESULTS_STREAM)
 
-    df = pd.DataFrame(results, columns=["BeltSpeed", "IndexSpeed", "GantrySpeed1", "GantrySpeed2", "Makespan", "Profit"])
-    df["Configuration"] = df.apply(lambda row: f"Belt={row['BeltSpeed']}, Index={row['IndexSpeed']}, Gantry1={row['GantrySpeed1']}, Gantry2={row['GantrySpeed2']}", axis=1)
-    df.to_csv("design_space_results.csv", index=False)
+    if args.command == "optimize":
+        results = optimize(args.method, trace_ini_path, model_file, args.budget, workers=args.workers, seed=args.seed,
+                           timeouts=timeouts, retries=args.retries, failures=failures, stream=RESULTS_STREAM)
+    elif args.watch:
+        try:
+            watch(configurations, trace_ini_path, model_file, timeouts=timeouts, retries=args.retries)
+        except KeyboardInterrupt:
+            parser.exit(message="Stopped watching\n")
+    elif args.replications:
+        if args.max_replications < 2:
+            parser.error("--max-replications must be at least 2 to estimate a confidence interval")
+        results = replicate(configurations, trace_ini_path, model_file, precision=args.precision, max_replications=args.max_replications,
+                            workers=args.workers, timeouts=timeouts, retries=args.retries, failures=failures, stream=RESULTS_STREAM)
+        columns = REPLICATION_COLUMNS
+    elif args.screen:
+        try:
+            screened, results, correlation = screen(configurations, trace_ini_path, model_file, args.screen, args.screen_products,
+                                                    timeouts=timeouts, retries=args.retries, failures=failures, stream=RESULTS_STREAM)
+        except ValueError as error:
+            parser.error(str(error))
+        screened_df = pd.DataFrame(screened, columns=RESULT_COLUMNS)
+        screened_df.to_csv("design_space_screening.csv", index=False)
+    elif args.steady_state:
+        results = steady_state_sweep(configurations, trace_ini_path, model_file, window=args.steady_window, tolerance=args.steady_tolerance,
+                                     validate=args.validate, timeouts=timeouts, retries=args.retries, failures=failures,
+                                     stream=RESULTS_STREAM)
+        columns = STEADY_STATE_COLUMNS
+    elif args.makespan_only:
+        results = makespan_sweep(configurations, trace_ini_path, model_file, inspect=args.inspect, trace_dir=args.keep_traces or "traces",
+                                 workers=args.workers, timeouts=timeouts, retries=args.retries, failures=failures, stream=RESULTS_STREAM)
+    elif args.workers and args.workers > 1:
+        results = []
+        evaluate_batch = parallel_evaluator(trace_ini_path, model_file, workers=args.workers, timeouts=timeouts, retries=args.retries,
+                                            results=results, failures=failures, trace_dir=args.keep_traces, stream=RESULTS_STREAM)
+        evaluate_batch(configurations)
+    else:
+        results = sweep(configurations, trace_ini_path, model_file, timeouts=timeouts, retries=args.retries, failures=failures,
+                        trace_dir=args.keep_traces, stream=RESULTS_STREAM)
 
-    fig = px.scatter(
-        df, x="Makespan", y="Profit", color="Configuration", size=[10] * len(df), title="Makespan vs Profit",
-        labels={"Makespan": "Makespan (s)", "Profit": "Profit ($)"}
-    )
-    fig.show()
+    if failures:
+        write_failure_report(failures, FAILURE_REPORT)
+        print(f"{len(failures)} configuration(s) failed, see {FAILURE_REPORT}")
+    elif os.path.exists(FAILURE_REPORT):
+        # A report from an earlier sweep would otherwise look like it belongs to this one.
+        os.remove(FAILURE_REPORT)
+
+    df = results_frame(results, columns)
+    df.to_csv(RESULTS_FILE, index=False)
+    if os.path.exists(RESULTS_STREAM):
+        os.remove(RESULTS_STREAM)
+    plot_results(df)
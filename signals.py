@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+import numpy as np
+
+from etf import Fragment, Signal
+
+# Speeds at or below this magnitude count as standing still.
+MOVING_THRESHOLD = 1e-9
+
+
+def read_signals(records):
+    names = {}
+    fragments = defaultdict(list)
+    for record in records:
+        if isinstance(record, Signal):
+            names[record.id] = record.name
+        elif isinstance(record, Fragment) and record.end > record.start:
+            # Zero-length fragments only mark the end of a signal.
+            coefficients = (record.coefficients + (0.0, 0.0, 0.0))[:3]
+            fragments[record.signal].append((record.start, record.end, *coefficients))
+
+    signals = {}
+    for signal, name in names.items():
+        rows = np.array(sorted(fragments[signal]), dtype=float).reshape(-1, 5)
+        signals[name] = {"start": rows[:, 0], "end": rows[:, 1], "coefficients": rows[:, 2:]}
+    return signals
+
+
+def signal_metrics(signal, horizon):
+    durations = signal["end"] - signal["start"]
+    c = signal["coefficients"]
+    # Exact integral of c0 + c1 t + c2 t^2 over every fragment.
+    distance = float(np.sum(np.abs(c[:, 0] * durations + c[:, 1] * durations ** 2 / 2 + c[:, 2] * durations ** 3 / 3)))
+    constant = (c[:, 1] == 0) & (c[:, 2] == 0)
+    moving = np.abs(c[:, 0]) > MOVING_THRESHOLD
+    speeds, inverse = np.unique(c[constant, 0], return_inverse=True)
+    time_at_speed = dict(zip(speeds.tolist(), np.bincount(inverse, weights=durations[constant]).tolist()))
+    return {
+        "duty_cycle": float(durations[moving | ~constant].sum() / horizon) if horizon else 0.0,
+        "distance": distance,
+        "time_at_speed": time_at_speed,
+    }
+
+
+def belt_summary(records):
+    signals = read_signals(records)
+    horizon = max((signal["end"].max() for signal in signals.values() if len(signal["end"])), default=0.0)
+    summary = {}
+    for name, signal in sorted(signals.items()):
+        metrics = signal_metrics(signal, horizon)
+        summary[f"{name}_duty"] = metrics["duty_cycle"]
+        summary[f"{name}_distance"] = metrics["distance"]
+        for speed, duration in metrics["time_at_speed"].items():
+            summary[f"{name}_time_at_{speed:g}"] = duration
+    summary["TotalDistance"] = sum(value for key, value in summary.items() if key.endswith("_distance"))
+    return summary
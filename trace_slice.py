@@ -0,0 +1,225 @@
+import argparse
+import re
+from collections import defaultdict, deque
+
+from etf import Claim, Event, Fragment, Resource, Signal, open_trace, parse_record
+
+# Claims and fragments closer than this (in trace time units) are considered back-to-back.
+ADJACENCY_TOLERANCE = 1e-9
+
+FILTER_ITEM = re.compile(r"(\w+)\s*=\s*(\[[^\]]*\]|[^,}]*)")
+
+
+def parse_filter(text):
+    filters = {}
+    for key, values in FILTER_ITEM.findall(text.strip().strip("{}")):
+        values = values.strip().strip("[]")
+        filters[key] = {value.strip().strip('"') for value in re.split(r"[,|]", values) if value.strip()}
+    return filters
+
+
+def read_view(path):
+    settings = {}
+    with open(path, 'r') as file:
+        for line in file:
+            key, separator, value = line.partition(":")
+            if separator:
+                settings[key.strip()] = value.strip()
+    return settings
+
+
+def slice_settings(view):
+    return {
+        "claims": view.get("showClaims", "true") == "true",
+        "events": view.get("showEvents", "true") == "true",
+        "signals": view.get("showSignals", "true") == "true",
+        "grouping": [key.strip() for key in view.get("claimGrouping", "").split(",") if key.strip()],
+        "claim_filter": parse_filter(view.get("claimFiltering", "{}")),
+        "event_filter": parse_filter(view.get("eventFiltering", "{}")),
+        "resource_filter": parse_filter(view.get("resourceFiltering", "{}")),
+        "signal_filter": parse_filter(view.get("signalFiltering", "{}")),
+    }
+
+
+def format_number(value):
+    text = repr(value)
+    return text[:-2] if text.endswith(".0") else text
+
+
+def format_claim(claim):
+    attributes = ",".join(f"{key}={value}" for key, value in claim.attributes.items())
+    return (f"C {claim.id} {format_number(claim.start)} {format_number(claim.end)} {claim.resource} "
+            f"{format_number(claim.amount)}; {attributes}\n")
+
+
+def format_fragment(fragment):
+    coefficients = " ".join(format_number(value) for value in fragment.coefficients)
+    return f"F {fragment.signal} {format_number(fragment.start)} {format_number(fragment.end)} {coefficients}\n"
+
+
+def format_record(record):
+    return format_claim(record) if isinstance(record, Claim) else format_fragment(record)
+
+
+def matches(attributes, filters):
+    return all(attributes.get(key) in values for key, values in filters.items())
+
+
+def overlaps(start, end, begin, until):
+    return (begin is None or end >= begin) and (until is None or start <= until)
+
+
+def slice_trace(source, target, settings, begin=None, until=None, merge_fragments=False, coalesce_claims=False):
+    resource_filter = settings["resource_filter"].get("name")
+    signal_filter = settings["signal_filter"].get("name")
+    resources = {}
+    signals = set()
+    # Records still held for merging keep their place in the output, [record, open]; everything queued behind the first
+    # open one waits, so the output stays in the order of the input trace.
+    output = deque()
+    held_claims = {}
+    held_fragments = {}
+    longest = defaultdict(float)
+    written = 0
+
+    def keep_signal(name):
+        if signal_filter is not None:
+            return name in signal_filter
+        # Signals are named after their resource, e.g. Belt_1_speed belongs to Belt_1.
+        return resource_filter is None or any(name.startswith(resource + "_") for resource in resource_filter)
+
+    def release():
+        nonlocal written
+        while output and (isinstance(output[0], str) or not output[0][1]):
+            item = output.popleft()
+            if item[0] is not None:
+                target.write(item if isinstance(item, str) else format_record(item[0]))
+                written += 1
+
+    def write(line):
+        output.append(line)
+        release()
+
+    def hold(held, key, record):
+        longest[key] = max(longest[key], record.end - record.start)
+        held[key] = [record, True]
+        output.append(held[key])
+
+    def extend(held, key, record):
+        # The merged record ends with the record that extends it, so it moves to that record's place.
+        merged = held[key][0]._replace(end=record.end)
+        held[key][0] = None
+        held[key][1] = False
+        hold(held, key, merged)
+        release()
+
+    def close(held, key):
+        held.pop(key)[1] = False
+        release()
+
+    with open_trace(source) as file:
+        for line in file:
+            record = parse_record(line)
+
+            if record is None:
+                if line[:1] in ("T", "O"):
+                    write(line)
+            elif isinstance(record, Resource):
+                if resource_filter is None or record.name in resource_filter:
+                    resources[record.id] = record.name
+                    write(line)
+            elif isinstance(record, Signal):
+                if settings["signals"] and keep_signal(record.name):
+                    signals.add(record.id)
+                    write(line)
+            elif isinstance(record, Claim):
+                attributes = dict(record.attributes, resource=record.attributes.get("resource", resources.get(record.resource)))
+                if (not settings["claims"] or record.resource not in resources
+                        or not matches(attributes, settings["claim_filter"])
+                        or not overlaps(record.start, record.end, begin, until)):
+                    continue
+                if not coalesce_claims:
+                    write(line)
+                    continue
+                # Claims on a resource arrive in time order, so the next one decides whether the held claim continues.
+                # Claims of different products are never merged, whatever the grouping.
+                pending = held_claims.get(record.resource)
+                if (pending and abs(record.start - pending[0].end) <= ADJACENCY_TOLERANCE and pending[0].amount == record.amount
+                        and all(pending[0].attributes.get(name) == record.attributes.get(name)
+                                for name in settings["grouping"] + ["pid"])):
+                    extend(held_claims, record.resource, record)
+                    continue
+                if pending:
+                    close(held_claims, record.resource)
+                hold(held_claims, record.resource, record)
+            elif isinstance(record, Event):
+                if (settings["events"] and matches(record.attributes, settings["event_filter"])
+                        and overlaps(record.time, record.time, begin, until)):
+                    write(line)
+            elif isinstance(record, Fragment):
+                if record.signal not in signals or not overlaps(record.start, record.end, begin, until):
+                    continue
+                if not merge_fragments:
+                    write(line)
+                    continue
+                pending = held_fragments.get(record.signal)
+                # Only constant fragments can be merged without re-basing their polynomial.
+                if (pending and abs(record.start - pending[0].end) <= ADJACENCY_TOLERANCE
+                        and pending[0].coefficients == record.coefficients and not any(record.coefficients[1:])):
+                    extend(held_fragments, record.signal, record)
+                    continue
+                if pending:
+                    close(held_fragments, record.signal)
+                hold(held_fragments, record.signal, record)
+
+            # The trace is written in order of end time. Once it has moved past a held record by more than the longest claim
+            # or fragment seen on its resource or signal, a continuation is unlikely, so the record no longer blocks output.
+            if isinstance(record, (Claim, Event, Fragment)):
+                now = record.time if isinstance(record, Event) else record.end
+                for held in (held_claims, held_fragments):
+                    for key in [key for key, (pending, _) in held.items() if pending.end + longest[key] < now]:
+                        close(held, key)
+
+    for held in (held_claims, held_fragments):
+        for key in list(held):
+            close(held, key)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a reduced ETF trace containing only the records of interest")
+    parser.add_argument("trace", help="input trace (.etf or .etf.gz)")
+    parser.add_argument("-o", "--output", required=True, help="reduced output trace (.etf or .etf.gz)")
+    parser.add_argument("--view", help="take filter, grouping and show settings from a .view file")
+    parser.add_argument("--resource", action="append", help="keep only this resource (repeatable)")
+    parser.add_argument("--claim", action="append", help="keep only claims with this name (repeatable)")
+    parser.add_argument("--pid", action="append", help="keep only claims of this pid (repeatable)")
+    parser.add_argument("--start", type=float, help="drop records that end before this time")
+    parser.add_argument("--end", type=float, help="drop records that start after this time")
+    parser.add_argument("--no-events", action="store_true", help="drop all events")
+    parser.add_argument("--no-signals", action="store_true", help="drop all signals and their fragments")
+    parser.add_argument("--merge-fragments", action="store_true", help="merge adjacent identical constant signal fragments")
+    parser.add_argument("--coalesce-claims", action="store_true",
+                        help="merge back-to-back claims on the same resource with the same grouping attributes")
+    args = parser.parse_args(argv)
+
+    settings = slice_settings(read_view(args.view) if args.view else {})
+    if args.resource:
+        settings["resource_filter"]["name"] = set(args.resource)
+    if args.claim:
+        settings["claim_filter"]["name"] = set(args.claim)
+    if args.pid:
+        settings["claim_filter"]["pid"] = set(args.pid)
+    if args.no_events:
+        settings["events"] = False
+    if args.no_signals:
+        settings["signals"] = False
+
+    with open_trace(args.output, 'wt') as target:
+        written = slice_trace(args.trace, target, settings, begin=args.start, until=args.end,
+                              merge_fragments=args.merge_fragments, coalesce_claims=args.coalesce_claims)
+    print(f"Wrote {written} records to {args.output}")
+
+
+if __name__ == "__main__":
+    main()